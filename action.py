@@ -19,31 +19,272 @@ import os
 import json
 import asyncio
 import subprocess
+from ast import literal_eval
+from functools import lru_cache
+import numpy as np
 #import win32gui
 #import win32con
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from PIL import Image, ImageDraw, ImageFont
 # from pywinauto.application import Application
 # from pywinauto.keyboard import send_keys
 # from pywinauto import mouse, findwindows
 # from pywinauto.controls.hwndwrapper import HwndWrapper
 import logging
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; fall back to the NumPy reduction
+    njit = None
+
 from models import validate_input, validate_output, function_schemas
+from speedups import json_loads
 #from logger import mcp_server_logger
 import inspect
+import types
 
 
 # Gmail configuration
 app_password = os.getenv('GMAIL_APP_PASSWORD')  # App-specific password
 
+# Shared SMTP session so TLS + AUTH are paid once per process rather than per email
+_smtp_conn: Optional[smtplib.SMTP_SSL] = None
+_smtp_lock = asyncio.Lock()
+
 # Global paint instance
 paint_app = None
 
+# Longest Fibonacci prefix computed so far; only ever grows, so it can be shared across calls
+_FIB_CACHE = [0, 1]
+
+# Exact factorials up to 170! (the largest that still fits in a float); factorial() indexes this
+_FACT_LUT = tuple(math.factorial(i) for i in range(171))
+
+# Above this length add_list reduces in NumPy; below it the array setup costs more than it saves
+_NUMPY_MIN_LEN = 64
+
+# Pure CPU tools that finish in microseconds; act() calls these inline instead of via the thread pool
+_INLINE_TOOLS = frozenset({
+    'add', 'add_list', 'subtract', 'multiply', 'divide', 'power', 'sqrt', 'cbrt',
+    'factorial', 'log', 'remainder', 'sin', 'cos', 'tan', 'mine',
+    'strings_to_chars_to_int', 'fibonacci_numbers', 'fibonacci_nth',
+    'show_reasoning', 'calculate', 'verify',
+})
+
+# Tools whose (single) parameter is a list and may arrive as a "[...]" string
+_LIST_TOOLS = frozenset({'add_list', 'int_list_to_exponential_sum', 'show_reasoning'})
+
 logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# Share main.py's logger so tool output goes through its console and file handlers
+logger = logging.getLogger('cot_logger')
+
+
+# The terms span dozens of orders of magnitude (e^65 .. e^127), so both kernels use a
+# compensated sum; verify() compares results against a tight tolerance.
+if njit is not None:
+    # No fastmath: reassociation would optimise the Neumaier compensation away
+    @njit(cache=True)
+    def _exp_sum_kernel(a):
+        """JIT-compiled, Neumaier-compensated sum of e^x over a float64 array."""
+        s = 0.0
+        c = 0.0
+        for i in range(a.shape[0]):
+            x = math.exp(a[i])
+            t = s + x
+            if abs(s) >= abs(x):
+                c += (s - t) + x
+            else:
+                c += (x - t) + s
+            s = t
+        return s + c
+else:
+    def _exp_sum_kernel(a):
+        """Exactly rounded sum of e^x over a float64 array, using NumPy's vectorized exp."""
+        # Overflow yields inf, which the caller turns into OverflowError for both kernels
+        with np.errstate(over='ignore'):
+            return math.fsum(np.exp(a))
+
+
+def _fib_pair(n: int) -> Tuple[int, int]:
+    """Return (F(n), F(n+1)) using the fast-doubling identities.
+
+    F(2k) = F(k) * (2*F(k+1) - F(k)) and F(2k+1) = F(k)^2 + F(k+1)^2, so only
+    O(log n) big-integer multiplications are needed.
+    """
+    if n == 0:
+        return 0, 1
+    a, b = _fib_pair(n >> 1)
+    c = a * (2 * b - a)
+    d = a * a + b * b
+    if n & 1:
+        return d, c + d
+    return c, d
+
+
+# Names visible to expressions evaluated by calculate/verify; builtins are not exposed
+_MATH_NS = {name: getattr(math, name) for name in dir(math) if not name.startswith('_')}
+_MATH_NS.update(math=math, abs=abs, round=round, min=min, max=max, sum=sum, pow=pow, int=int, float=float)
+# Passed as globals (not locals) so generator expressions and lambdas, which only
+# see globals, can resolve the math names too
+_EVAL_GLOBALS = {'__builtins__': {}, **_MATH_NS}
+
+
+@lru_cache(maxsize=512)
+def _compile_expr(expression: str) -> types.CodeType:
+    """Compile an expression once; repeated calculate/verify calls reuse the code object."""
+    return compile(expression, '<calc>', 'eval')
+
+
+def _eval_expr(expression: str) -> Any:
+    """Evaluate an expression against the restricted math namespace."""
+    # Strip first so the self-check loop's re-sent expressions hit the cache despite stray whitespace
+    return eval(_compile_expr(str(expression).strip()), _EVAL_GLOBALS)
+
+
+def _parse_list_string(value: str) -> list:
+    """Parse a "[1, 2, 3]"-style string into a list.
+
+    Uses ast.literal_eval so nested lists, negative numbers and quoted strings
+    containing commas come back correctly; falls back to a plain comma split
+    for payloads that are not valid Python literals (e.g. "[a, b]").
+    """
+    try:
+        parsed = literal_eval(value)
+        if isinstance(parsed, (list, tuple)):
+            return list(parsed)
+    except (ValueError, SyntaxError):
+        pass
+    clean_list = value.strip('[]')
+    if not clean_list:
+        return []
+    return [item.strip().strip("'\"") for item in clean_list.split(',')]
+
+
+# Characters dropped from "[73, '78', 68]"-style payloads before splitting on commas.
+# Spaces are kept: int() ignores them around an item, and deleting them would merge
+# "[1 2 3]" into 123 instead of falling back to the general parser.
+_INT_LIST_STRIP = b"'\"[]"
+
+
+def _parse_int_list_string(value: str) -> list:
+    """Parse a list string of plain integers in one C-level pass.
+
+    Deleting brackets and quotes with bytes.translate leaves "73, 78, 68",
+    which splits straight into int(); anything else (floats, words, spaced
+    digits, non-ASCII, empty lists) goes through _parse_list_string.
+    """
+    try:
+        return list(map(int, value.encode('ascii').translate(None, _INT_LIST_STRIP).split(b',')))
+    except (UnicodeEncodeError, ValueError):
+        return _parse_list_string(value)
+
+
+# Mac system fonts first, then DejaVu (bundled with most Linux distributions)
+_FONT_CANDIDATES = (
+    "/System/Library/Fonts/Arial.ttf",
+    "/System/Library/Fonts/Helvetica.ttc",
+    "DejaVuSans.ttf",
+)
+
+
+@lru_cache(maxsize=None)
+def _load_font(size: int):
+    """Load the first available TrueType font at the given size, or PIL's default.
+
+    Cached per size, so each font file is parsed once per process.
+    """
+    # PIL is imported lazily so runs that never draw an image don't pay for it
+    from PIL import ImageFont
+    for path in _FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+# Canvas size for create_image_with_text (larger to accommodate wrapped text)
+_IMAGE_SIZE = (900, 500)
+
+
+@lru_cache(maxsize=1)
+def _image_template():
+    """Return the answer card with background, title and border pre-drawn.
+
+    Built once; callers must .copy() it before drawing the per-call result.
+    """
+    from PIL import Image, ImageDraw
+    width, height = _IMAGE_SIZE
+    image = Image.new('RGB', _IMAGE_SIZE, color='white')
+    draw = ImageDraw.Draw(image)
+
+    # Add title
+    title_font = _load_font(28)
+    title = "Final Answer"
+    title_bbox = draw.textbbox((0, 0), title, font=title_font)
+    title_width = title_bbox[2] - title_bbox[0]
+    title_x = (width - title_width) // 2
+    draw.text((title_x, 40), title, fill='black', font=title_font)
+
+    # Add a decorative rectangle border
+    draw.rectangle([30, 20, width-30, height-30], outline='black', width=3)
+    return image
+
+
+def _wrap_first_fit(fragments: List[Tuple[str, float]], space_w: float, max_width: float) -> List[str]:
+    """Break (word, width) fragments into lines with a greedy first-fit pass.
+
+    Runs in linear time with one width lookup per word; a word wider than
+    max_width gets a line to itself.
+    """
+    lines = []
+    cur = []
+    cur_w = 0.0
+    for word, word_w in fragments:
+        if cur and cur_w + space_w + word_w > max_width:
+            lines.append(' '.join(cur))
+            cur = [word]
+            cur_w = word_w
+        elif cur:
+            cur.append(word)
+            cur_w += space_w + word_w
+        else:
+            cur = [word]
+            cur_w = word_w
+    if cur:
+        lines.append(' '.join(cur))
+    return lines
+
+
+def _smtp_connect(sender_email: str) -> smtplib.SMTP_SSL:
+    """Open and authenticate a new Gmail SMTP session."""
+    server = smtplib.SMTP_SSL("smtp.gmail.com", 465)
+    try:
+        server.login(sender_email, app_password)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+async def _get_smtp(sender_email: str) -> smtplib.SMTP_SSL:
+    """Return the shared SMTP session, reconnecting if the server dropped it.
+
+    Callers must hold _smtp_lock. Blocking smtplib calls run in a worker thread.
+    """
+    global _smtp_conn
+    if _smtp_conn is not None:
+        try:
+            status, _ = await asyncio.to_thread(_smtp_conn.noop)
+            if status == 250:
+                return _smtp_conn
+        except (smtplib.SMTPException, OSError):
+            pass
+        _smtp_conn.close()
+        _smtp_conn = None
+    _smtp_conn = await asyncio.to_thread(_smtp_connect, sender_email)
+    return _smtp_conn
 
 class TextContent:
     """Response content wrapper with type information."""
@@ -60,6 +301,9 @@ class TextContent:
         return TextContent(text=str(text))
 
 class Action:
+    # One "- name(params) - summary" line per tool, built once after the class is defined
+    TOOLS_DESCRIPTION: str = ""
+
     def __init__(self):
         # Map tool names to bound methods so they can be called from an Action instance
         self.func_map = {
@@ -80,6 +324,7 @@ class Action:
             'strings_to_chars_to_int': self.strings_to_chars_to_int,
             'int_list_to_exponential_sum': self.int_list_to_exponential_sum,
             'fibonacci_numbers': self.fibonacci_numbers,
+            'fibonacci_nth': self.fibonacci_nth,
             'show_reasoning': self.show_reasoning,
             'calculate': self.calculate,
             'verify': self.verify,
@@ -89,6 +334,15 @@ class Action:
             'open_image_in_preview': self.open_image_in_preview,  # Mac - opens in Preview
             'send_email': self.send_email,
         }
+        # Reflect on each tool once; act() looks signatures up here instead of calling inspect per dispatch
+        self._sig_cache = {}
+        # Per-tool (arity, takes_list) so act() can pick the positional fast path without reflection
+        self._dispatch = {}
+        for name, fn in self.func_map.items():
+            sig = inspect.signature(fn)
+            param_names = [p for p in sig.parameters if p != 'self']
+            self._sig_cache[name] = (sig, param_names)
+            self._dispatch[name] = (len(param_names), name in _LIST_TOOLS)
 
     async def act(self, func_name: str, params: Union[List[Any], Dict[str, Any]]) -> Any:
         """Execute a tool by name with the given parameters.
@@ -107,11 +361,11 @@ class Action:
             # Find the matching tool
             tool = self.func_map.get(func_name)
             if not tool:
-                logger.info(f"DEBUG: Available tools: {list(self.func_map.keys())}")
+                logger.debug("DEBUG: Available tools: %s", list(self.func_map.keys()))
                 raise ValueError(f"Unknown tool: {func_name}")
 
-            # Get function signature
-            sig = inspect.signature(tool)
+            # Get cached function signature
+            sig, param_names = self._sig_cache[func_name]
             arguments = {}
             
             # Handle parameters based on their type
@@ -122,49 +376,47 @@ class Action:
                         raise ValueError(f"Unknown parameter {name} for {func_name}")
                     arguments[name] = value
             else:
+                arity, takes_list = self._dispatch[func_name]
+                # Scalar tools called with exactly their arity: pass params positionally
+                if not takes_list and len(params) == arity:
+                    logger.debug("DEBUG: Calling tool %s positionally with %s", func_name, params)
+                    return await self._run_tool(func_name, tool, *params)
+
                 # List params - map to parameter names in order
-                param_names = [name for name in sig.parameters 
-                             if name != 'self']
-                
                 # Special handling for functions that expect a single list parameter
                 if func_name == 'int_list_to_exponential_sum' and len(param_names) == 1:
-                    logger.info(f"DEBUG: Special handling for int_list_to_exponential_sum")
-                    logger.info(f"DEBUG: Raw params: {params}")
-                    logger.info(f"DEBUG: Param count: {len(params)}")
+                    logger.debug("DEBUG: Special handling for int_list_to_exponential_sum")
+                    logger.debug("DEBUG: Raw params: %s", params)
+                    logger.debug("DEBUG: Param count: %s", len(params))
                     
                     # If we have multiple params but function expects 1 list, combine them
                     if len(params) > 1:
-                        logger.info(f"DEBUG: Combining multiple params into list")
+                        logger.debug("DEBUG: Combining multiple params into list")
                         arguments[param_names[0]] = params  # Pass all params as a list
                     else:
                         # Single parameter - handle normally
                         value = params[0]
-                        logger.info(f"DEBUG: Single param value: {value}")
-                        logger.info(f"DEBUG: Value type: {type(value)}")
+                        logger.debug("DEBUG: Single param value: %s", value)
+                        logger.debug("DEBUG: Value type: %s", type(value))
                         
                         if isinstance(value, str):
                             if value.startswith('[') and value.endswith(']'):
                                 try:
-                                    clean_list = value.strip('[]')
-                                    if clean_list:
-                                        value = [item.strip().strip("'\"") for item in clean_list.split(',')]
-                                    else:
-                                        value = []
-                                    logger.info(f"DEBUG: Parsed list value: {value}")
+                                    value = _parse_int_list_string(value)
+                                    logger.debug("DEBUG: Parsed list value: %s", value)
                                 except Exception as e:
-                                    logger.info(f"Failed to parse list parameter: {e}")
+                                    logger.info("Failed to parse list parameter: %s", e)
                             elif value.startswith('{') and '"numbers"' in value:
                                 try:
-                                    import json
-                                    data = json.loads(value)
+                                    data = json_loads(value)
                                     value = data.get('numbers', [])
-                                    logger.info(f"DEBUG: Parsed JSON value: {value}")
+                                    logger.debug("DEBUG: Parsed JSON value: %s", value)
                                 except json.JSONDecodeError as e:
-                                    logger.info(f"Failed to parse JSON parameter: {e}")
+                                    logger.info("Failed to parse JSON parameter: %s", e)
                                     # Keep original value and let the function handle it
                         arguments[param_names[0]] = value
                     
-                    logger.info(f"DEBUG: Final arguments for int_list_to_exponential_sum: {arguments}")
+                    logger.debug("DEBUG: Final arguments for int_list_to_exponential_sum: %s", arguments)
                 else:
                     # Normal parameter handling
                     if len(params) != len(param_names):
@@ -176,13 +428,9 @@ class Action:
                         if isinstance(value, str) and value.startswith('[') and value.endswith(']'):
                             try:
                                 # Convert string list "[1,2,3]" to actual list
-                                clean_list = value.strip('[]')
-                                if clean_list:  # Only split if not empty
-                                    value = [item.strip().strip("'\"") for item in clean_list.split(',')]
-                                else:
-                                    value = []
+                                value = _parse_list_string(value)
                             except Exception as e:
-                                logger.info(f"Failed to parse list parameter: {e}")
+                                logger.info("Failed to parse list parameter: %s", e)
                         arguments[name] = value
                 
                 # # Convert the value to the correct type based on the schema
@@ -198,27 +446,33 @@ class Action:
                 # else:
                 #     arguments[param_name] = str(value)
 
-            logger.info(f"DEBUG: Final arguments: {arguments}")
-            logger.info(f"DEBUG: Calling tool {func_name}")
-            # Call async tools with await; run sync tools in a thread pool so the event loop is not blocked.
-            try:
-                if asyncio.iscoroutinefunction(tool):
-                    result = await tool(**arguments)
-                else:
-                    loop = asyncio.get_running_loop()
-                    maybe = await loop.run_in_executor(None, lambda: tool(**arguments))
-                    # If a sync tool unexpectedly returned a coroutine, await it.
-                    if asyncio.iscoroutine(maybe):
-                        result = await maybe
-                    else:
-                        result = maybe
-                    return result             
-            except Exception as e:
-                logger.exception(f"Error while calling tool {func_name}")
-                raise
+            logger.debug("DEBUG: Final arguments: %s", arguments)
+            logger.debug("DEBUG: Calling tool %s", func_name)
+            return await self._run_tool(func_name, tool, **arguments)
             # result = await session.call_tool(func_name, arguments=arguments)
         except Exception as e:
-            logger.exception(f"Error in act method for tool {func_name}: {str(e)}")
+            logger.exception("Error in act method for tool %s: %s", func_name, e)
+            raise
+
+    @staticmethod
+    async def _run_tool(func_name: str, tool, *args, **kwargs) -> Any:
+        """Invoke a resolved tool with already-prepared arguments.
+
+        Async tools are awaited and cheap sync tools run inline; the rest run in a
+        thread pool so the event loop is not blocked.
+        """
+        try:
+            if asyncio.iscoroutinefunction(tool):
+                return await tool(*args, **kwargs)
+            if func_name in _INLINE_TOOLS:
+                return tool(*args, **kwargs)
+            result = await asyncio.to_thread(tool, *args, **kwargs)
+            # If a sync tool unexpectedly returned a coroutine, await it.
+            if asyncio.iscoroutine(result):
+                result = await result
+            return result
+        except Exception:
+            logger.exception("Error while calling tool %s", func_name)
             raise
             
         # Paint window handling
@@ -338,6 +592,16 @@ class Action:
         Returns:
             Sum of all numbers as integer
         """
+        if len(numbers) > _NUMPY_MIN_LEN and not any(isinstance(x, str) for x in numbers[:4]):
+            try:
+                arr = np.asarray(numbers, dtype=np.int64)
+            except (OverflowError, TypeError, ValueError):
+                arr = None
+            if arr is not None:
+                # Only trust the int64 reduction when the total cannot wrap around
+                bound = np.iinfo(np.int64).max // len(arr)
+                if -bound <= arr.min() and arr.max() <= bound:
+                    return int(arr.sum())
         return sum(map(int, numbers))
 
     @staticmethod
@@ -411,7 +675,7 @@ class Action:
         a = float(a)
         if a < 0:
             raise ValueError("Cannot calculate square root of negative number")
-        return a ** 0.5
+        return math.sqrt(a)
 
     @staticmethod
     def cbrt(a: Union[int, float, str]) -> float:
@@ -423,7 +687,10 @@ class Action:
         Returns:
             Cube root of a as float
         """
-        return float(a) ** (1/3)
+        a = float(a)
+        if hasattr(math, 'cbrt'):  # Python 3.11+
+            return math.cbrt(a)
+        return math.copysign(abs(a) ** (1/3), a)
 
     @staticmethod
     def factorial(a: Union[int, float, str]) -> int:
@@ -441,6 +708,8 @@ class Action:
         a = int(a)
         if a < 0:
             raise ValueError("Factorial not defined for negative numbers")
+        if a < len(_FACT_LUT):
+            return _FACT_LUT[a]
         return math.factorial(a)
 
     @staticmethod
@@ -527,7 +796,12 @@ class Action:
         Returns:
             List of integer ASCII values for each character
         """
-        return [ord(char) for char in text]
+        if text.isascii():
+            # Byte values equal code points for ASCII; iterating bytes stays in C
+            return list(text.encode('ascii'))
+        # UTF-32 stores one code point per 4-byte word, so reinterpreting the buffer yields ord() values;
+        # surrogatepass keeps lone surrogates (e.g. from JSON "\ud800" escapes) encodable like ord()
+        return np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype='<u4').tolist()
 
     @staticmethod
     def int_list_to_exponential_sum(int_list: Union[List[Union[int, str]], str]) -> float:
@@ -542,18 +816,17 @@ class Action:
         Raises:
             ValueError: If input can't be converted to list of integers
         """
-        print(f"DEBUG: int_list_to_exponential_sum received: {repr(int_list)}")
-        print(f"DEBUG: Type: {type(int_list)}")
+        logger.debug("DEBUG: int_list_to_exponential_sum received: %s", repr(int_list))
+        logger.debug("DEBUG: Type: %s", type(int_list))
         
         # Handle string input
         if isinstance(int_list, str):
-            print(f"DEBUG: Processing string input: '{int_list}'")
+            logger.debug("DEBUG: Processing string input: '%s'", int_list)
             
             # Handle JSON string format like '{"numbers": [73, 78, 68, 73, 65]}'
             if int_list.startswith('{'):
-                print("DEBUG: Detected JSON-like string")
+                logger.debug("DEBUG: Detected JSON-like string")
                 try:
-                    import json
                     # Try to fix incomplete JSON by adding closing brackets
                     if not int_list.endswith('}'):
                         # Attempt to complete the JSON
@@ -569,44 +842,45 @@ class Action:
                             missing_braces = open_braces - close_braces
                             
                             completed_json = int_list + (']' * missing_brackets) + ('}' * missing_braces)
-                            print(f"DEBUG: Attempting to complete JSON: '{completed_json}'")
+                            logger.debug("DEBUG: Attempting to complete JSON: '%s'", completed_json)
                             int_list = completed_json
                     
-                    data = json.loads(int_list)
+                    data = json_loads(int_list)
                     int_list = data.get('numbers', [])
-                    print(f"DEBUG: Parsed JSON successfully: {int_list}")
+                    logger.debug("DEBUG: Parsed JSON successfully: %s", int_list)
                 except json.JSONDecodeError as e:
-                    print(f"DEBUG: JSON parsing failed: {e}")
+                    logger.debug("DEBUG: JSON parsing failed: %s", e)
                     raise ValueError(f"Failed to parse JSON string '{int_list}': {e}")
             elif int_list.startswith('[') and int_list.endswith(']'):
-                print("DEBUG: Detected list string format")
+                logger.debug("DEBUG: Detected list string format")
                 # Parse string list "[1,2,3]" format
-                clean_list = int_list.strip('[]')
-                if clean_list:
-                    int_list = [item.strip().strip("'\"") for item in clean_list.split(',')]
-                else:
-                    int_list = []
-                print(f"DEBUG: Parsed list: {int_list}")
+                int_list = _parse_int_list_string(int_list)
+                logger.debug("DEBUG: Parsed list: %s", int_list)
             elif ',' in int_list: # Handle comma-separated string without brackets
-                print("DEBUG: Detected comma-separated format")
+                logger.debug("DEBUG: Detected comma-separated format")
                 try:
                     int_list = [item.strip().strip("'\"") for item in int_list.split(',')]
-                    print(f"DEBUG: Parsed comma-separated: {int_list}")
+                    logger.debug("DEBUG: Parsed comma-separated: %s", int_list)
                 except Exception as e:
                     raise ValueError(f"Failed to parse comma-separated string as list: {e}")
             else:
                 raise ValueError(f"String input must be in list format [x,y,z] or JSON format. Got: '{int_list}'")
         
-        print(f"DEBUG: Final int_list before calculation: {int_list}")
+        logger.debug("DEBUG: Final int_list before calculation: %s", int_list)
         
-        # Convert all items to int and calculate sum
+        # Convert all items to int and calculate sum in a single vectorized pass
         try:
-            result = sum(math.exp(int(i)) for i in int_list)
-            print(f"DEBUG: Calculation successful: {result}")
+            arr = np.fromiter((int(i) for i in int_list), dtype=np.int64, count=len(int_list))
+            result = float(_exp_sum_kernel(arr.astype(np.float64)))
+            if not math.isfinite(result):
+                # An overflowed term is inf (NaN after the Numba kernel's compensation); raise
+                # like math.exp does, whichever kernel is installed
+                raise OverflowError("math range error")
+            logger.debug("DEBUG: Calculation successful: %s", result)
             return result
         except Exception as e:
-            print(f"DEBUG: Calculation failed: {e}")
-            print(f"DEBUG: int_list contents: {[repr(i) for i in int_list]}")
+            logger.debug("DEBUG: Calculation failed: %s", e)
+            logger.debug("DEBUG: int_list contents: %s", [repr(i) for i in int_list])
             raise
 
     @staticmethod
@@ -614,72 +888,29 @@ class Action:
         n = int(n)
         if n <= 0:
             return []
-        fib_sequence = [0, 1]
-        for _ in range(2, n):
-            fib_sequence.append(fib_sequence[-1] + fib_sequence[-2])
-        return fib_sequence[:n]
-
-    @staticmethod
-    def show_reasoning(steps):
-        """Show reasoning steps, handling both list and string inputs.
-        
-        Args:
-            steps: Either a list of steps or a string containing steps separated by periods
-                  or semicolons.
-        """
-        print("Reasoning steps:")
-        if isinstance(steps, str):
-            # Split on either periods or semicolons, handle both delimiters
-            if ';' in steps:
-                steps_list = [s.strip() for s in steps.split(';') if s.strip()]
-            else:
-                steps_list = [s.strip() for s in steps.split('.') if s.strip()]
-        else:
-            steps_list = steps
-            
-        for i, step in enumerate(steps_list, 1):
-            print(f"Step {i}: {step}")
-        return "Reasoning shown"
+        while len(_FIB_CACHE) < n:
+            _FIB_CACHE.append(_FIB_CACHE[-1] + _FIB_CACHE[-2])
+        return _FIB_CACHE[:n]
 
     @staticmethod
-    def calculate(expression: str) -> str:
-        """Calculate result of a mathematical expression.
+    def fibonacci_nth(n: Union[int, str]) -> int:
+        """Calculate the nth Fibonacci number (F(0) = 0, F(1) = 1).
         
         Args:
-            expression: String containing a valid Python math expression
+            n: Non-negative index into the sequence (will be converted to int)
             
         Returns:
-            String representation of result or error message
-        """
-        try:
-            result = eval(expression)
-            print(f"Result: {result}")
-            return str(result)
-        except Exception as e:
-            error_msg = f"Error: {str(e)}"
-            print(error_msg)
-            return error_msg
-
-    @staticmethod
-    def verify(expression: str, expected: Union[int, float, str]) -> str:
-        """Verify if an expression evaluates to expected value.
-        
-        Args:
-            expression: String containing a valid Python math expression
-            expected: Expected result (will be converted to float)
+            F(n) as integer
             
-        Returns:
-            "True" if equal within tolerance, "False" otherwise
+        Raises:
+            ValueError: If n is negative
         """
-        try:
-            actual = float(eval(expression))
-            is_correct = abs(actual - float(expected)) < 1e-10
-            print(f"Verify: {expression} == {expected} ? {is_correct}")
-            return str(is_correct)
-        except Exception as e:
-            error_msg = f"Error: {str(e)}"
-            print(error_msg)
-            return error_msg
+        n = int(n)
+        if n < 0:
+            raise ValueError("Fibonacci index must be non-negative")
+        if n < len(_FIB_CACHE):
+            return _FIB_CACHE[n]
+        return _fib_pair(n)[0]
 
     @staticmethod
     async def send_email(text: str) -> dict:
@@ -700,13 +931,18 @@ class Action:
             body = f"Hello, this is final answer to your question: {text}"
             msg.attach(MIMEText(body, "plain"))
 
-            # Send email via Gmail's SMTP server
-            with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-                server.login(sender_email, app_password)
-                server.send_message(msg)
+            # Send email via the shared Gmail SMTP session without blocking the event loop
+            async with _smtp_lock:
+                server = await _get_smtp(sender_email)
+                try:
+                    await asyncio.to_thread(server.send_message, msg)
+                except smtplib.SMTPServerDisconnected:
+                    # Dropped between the NOOP check and the send; reconnect once
+                    server = await _get_smtp(sender_email)
+                    await asyncio.to_thread(server.send_message, msg)
 
             #mcp_server_logger.info(f"Email sent successfully with content {text}")
-            print("Email sent successfully with content {text}")
+            logger.info("Email sent successfully with content %s", text)
             return {
                 "content": [
                     TextContent(
@@ -733,7 +969,7 @@ class Action:
             steps: Either a list of steps or a string containing steps separated by
                   periods or semicolons.
         """
-        print("\n=== Reasoning Steps ===")
+        logger.info("=== Reasoning Steps ===")
         
         if isinstance(steps, str):
             # Split on either periods or semicolons, handle both delimiters
@@ -745,8 +981,7 @@ class Action:
             steps_list = steps
             
         for i, step in enumerate(steps_list, 1):
-            print(f"\nStep {i}:")
-            print(f"  {step}")
+            logger.info("Step %s: %s", i, step)
             
         return "Reasoning shown"
 
@@ -754,35 +989,35 @@ class Action:
     @staticmethod
     def calculate(expression: str) -> str:
         """Calculate the result of an expression"""
-        print("\n=== Calculate ===")
-        print(f"Expression: {expression}")
+        logger.info("=== Calculate ===")
+        logger.info("Expression: %s", expression)
         try:
-            result = eval(expression)
-            print(f"Result: {result}")
+            result = _eval_expr(expression)
+            logger.info("Result: %s", result)
             return str(result)
         except Exception as e:
             error_msg = f"Error: {str(e)}"
-            print(error_msg)
+            logger.info(error_msg)
             return error_msg
 
     @staticmethod
     def verify(expression: str, expected: float) -> str:
         """Verify if a calculation is correct"""
-        print("\n=== Verify ===")
-        print(f"Checking: {expression} = {expected}")
+        logger.info("=== Verify ===")
+        logger.info("Checking: %s = %s", expression, expected)
         try:
-            actual = float(eval(expression))
+            actual = float(_eval_expr(expression))
             is_correct = abs(actual - float(expected)) < 1e-10
             
             if is_correct:
-                print(f"✓ Correct! {expression} = {expected}")
+                logger.info("✓ Correct! %s = %s", expression, expected)
             else:
-                print(f"✗ Incorrect! {expression} should be {actual}, got {expected}")
+                logger.info("✗ Incorrect! %s should be %s, got %s", expression, actual, expected)
                 
             return str(is_correct)
         except Exception as e:
             error_msg = f"Error: {str(e)}"
-            print(error_msg)
+            logger.info(error_msg)
             return error_msg
 
     @staticmethod
@@ -796,59 +1031,24 @@ class Action:
         Returns:
             Success message or error message
         """
+        from PIL import ImageDraw
         try:
-            # Create a new image with white background (larger to accommodate wrapped text)
-            width, height = 900, 500
-            image = Image.new('RGB', (width, height), color='white')
+            # Start from the cached template (white background, title and border already drawn)
+            width, height = _IMAGE_SIZE
+            image = _image_template().copy()
             draw = ImageDraw.Draw(image)
             
-            # Try to use a system font, fallback to default if not available
-            try:
-                # Mac system fonts
-                font = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", 20)
-                title_font = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", 28)
-            except:
-                try:
-                    # Alternative Mac font
-                    font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 20)
-                    title_font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 28)
-                except:
-                    # Fallback to default font
-                    font = ImageFont.load_default()
-                    title_font = ImageFont.load_default()
-            
-            # Add title
-            title = "Final Answer"
-            title_bbox = draw.textbbox((0, 0), title, font=title_font)
-            title_width = title_bbox[2] - title_bbox[0]
-            title_x = (width - title_width) // 2
-            draw.text((title_x, 40), title, fill='black', font=title_font)
-            
-            # Function to wrap text to fit within specified width
+            # Fonts are cached after the first call (system font, falling back to default)
+            font = _load_font(20)
+            
+            # Function to wrap text to fit within specified width. Each distinct word is
+            # measured once, then lines are filled first-fit from the precomputed widths.
             def wrap_text(text, font, max_width):
                 words = text.split(' ')
-                lines = []
-                current_line = []
-                
-                for word in words:
-                    test_line = ' '.join(current_line + [word])
-                    bbox = draw.textbbox((0, 0), test_line, font=font)
-                    line_width = bbox[2] - bbox[0]
-                    
-                    if line_width <= max_width:
-                        current_line.append(word)
-                    else:
-                        if current_line:
-                            lines.append(' '.join(current_line))
-                            current_line = [word]
-                        else:
-                            # Word is too long, break it
-                            lines.append(word)
-                
-                if current_line:
-                    lines.append(' '.join(current_line))
-                
-                return lines
+                word_widths = {w: draw.textlength(w, font=font) for w in set(words)}
+                space_w = draw.textlength(' ', font=font)
+                fragments = [(word, word_widths[word]) for word in words]
+                return _wrap_first_fit(fragments, space_w, max_width)
             
             # Prepare the result text with wrapping
             result_text = f"Result: {text}"
@@ -856,20 +1056,21 @@ class Action:
             wrapped_lines = wrap_text(result_text, font, max_text_width)
             
             # If we have more than 3 lines, limit to 3 and add "..." to the last line
-            if len(wrapped_lines) > 3:
-                wrapped_lines = wrapped_lines[:2]
-                last_line = wrapped_lines[1] if len(wrapped_lines) > 1 else wrapped_lines[0]
-                # Truncate last line if needed and add ellipsis
-                while True:
-                    test_line = last_line + "..."
-                    bbox = draw.textbbox((0, 0), test_line, font=font)
-                    if bbox[2] - bbox[0] <= max_text_width:
-                        wrapped_lines[1] = test_line
-                        break
-                    last_line = last_line[:-1]
-                    if len(last_line) < 10:  # Prevent infinite loop
-                        wrapped_lines[1] = last_line + "..."
-                        break
+            max_lines = 3
+            if len(wrapped_lines) > max_lines:
+                wrapped_lines = wrapped_lines[:max_lines]
+                last_line = wrapped_lines[-1]
+                # Truncate last line if needed and add ellipsis: binary search for the longest
+                # prefix that still fits, so only O(log n) measurements are needed
+                ellipsis_w = draw.textlength("...", font=font)
+                lo, hi = 0, len(last_line)
+                while lo < hi:
+                    mid = (lo + hi + 1) // 2
+                    if draw.textlength(last_line[:mid], font=font) + ellipsis_w <= max_text_width:
+                        lo = mid
+                    else:
+                        hi = mid - 1
+                wrapped_lines[-1] = last_line[:lo] + "..."
             
             # Draw each line of text
             line_height = 35
@@ -892,12 +1093,7 @@ class Action:
             ]
             
             info_start_y = start_y + (len(wrapped_lines) * line_height) + 30
-            info_font_size = 14
-            
-            try:
-                info_font = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", info_font_size)
-            except:
-                info_font = font
+            info_font = _load_font(14)
             
             for i, info_line in enumerate(info_lines):
                 bbox = draw.textbbox((0, 0), info_line, font=info_font)
@@ -906,18 +1102,16 @@ class Action:
                 line_y = info_start_y + (i * 25)
                 draw.text((line_x, line_y), info_line, fill='gray', font=info_font)
             
-            # Add a decorative rectangle border
-            draw.rectangle([30, 20, width-30, height-30], outline='black', width=3)
-            
-            # Save the image
-            image.save(filename)
+            # Save the image. It is a transient artifact, so favour encode speed over size:
+            # zlib level 1 and no extra optimize pass (ignored for non-PNG extensions)
+            image.save(filename, compress_level=1, optimize=False)
             
-            print(f"Image created successfully: {filename}")
+            logger.info("Image created successfully: %s", filename)
             return f"Image created successfully: {filename}"
             
         except Exception as e:
             error_msg = f"Error creating image: {str(e)}"
-            print(error_msg)
+            logger.error(error_msg)
             return error_msg
 
     @staticmethod
@@ -931,27 +1125,52 @@ class Action:
             Success message or error message
         """
         try:
-            import subprocess
-            import os
-            
-            # Check if file exists
-            if not os.path.exists(filename):
-                return f"Error: File {filename} does not exist"
-            
-            # Open with Mac Preview using 'open' command
+            # Open with Mac Preview using 'open' command; a missing file makes 'open' exit
+            # non-zero, which check=True reports as CalledProcessError
             subprocess.run(['open', '-a', 'Preview', filename], check=True)
             
-            print(f"Opened {filename} in Preview")
+            logger.info("Opened %s in Preview", filename)
             return f"Opened {filename} in Preview successfully"
             
         except subprocess.CalledProcessError as e:
             error_msg = f"Error opening Preview: {str(e)}"
-            print(error_msg)
+            logger.error(error_msg)
             return error_msg
         except Exception as e:
             error_msg = f"Error: {str(e)}"
-            print(error_msg)
+            logger.error(error_msg)
             return error_msg
 
-        
-            
+
+def _describe_tools(func_map: Dict[str, Any]) -> str:
+    """Render the sorted "- name(params) - summary" lines used in the system prompt."""
+    tools = []
+    for tool_name, tool_func in func_map.items():
+        try:
+            sig = inspect.signature(tool_func)
+            params = []
+            for param_name, param in sig.parameters.items():
+                if param_name == 'self':
+                    continue
+                param_type = param.annotation.__name__ if param.annotation != inspect._empty else "any"
+                params.append(f"{param_name}: {param_type}")
+
+            # Get docstring if available
+            doc = inspect.getdoc(tool_func) or "No description available"
+            doc_first_line = doc.split('\n')[0]
+
+            # Format tool description
+            tool_desc = f"- {tool_name}({', '.join(params)}) - {doc_first_line}"
+            tools.append(tool_desc)
+            logger.debug("Added description for tool: %s", tool_desc)
+        except Exception as e:
+            logger.error("Error processing tool %s: %s", tool_name, e)
+            continue
+
+    # Sort tools alphabetically for consistent display
+    tools.sort()
+    return "\n".join(tools)
+
+
+# The tool set is static, so describe it once at import rather than on every main() run
+Action.TOOLS_DESCRIPTION = _describe_tools(Action().func_map)
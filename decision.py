@@ -5,6 +5,10 @@ from typing import List, Optional, Union, Tuple, Any
 import re
 from models import validate_input, function_schemas
 
+# First FUNCTION_CALL line in a response, found in a single scan. A FUNCTION_CALL
+# anywhere wins over FINAL_ANSWER, even one on an earlier line.
+_CALL_RE = re.compile(r'^\s*FUNCTION_CALL:(.*)$', re.MULTILINE)
+
 class Decision():
     
     def __init__(self, response_text: str):
@@ -16,28 +20,23 @@ class Decision():
         """
         Parse the LLM response and return the appropriate function name
         """
-        # Look for FUNCTION_CALL in any line
-        function_call_line = None
-        for line in self.response_text.split('\n'):
-            line = line.strip()
-            if line.startswith("FUNCTION_CALL:"):
-                function_call_line = line
-                break
-        
-        if function_call_line:
-            # Parse FUNCTION_CALL
-            _, function_info = function_call_line.split(":", 1)
-            parts = [p.strip() for p in function_info.split("|")]
-            func_name, params = parts[0], parts[1:]
-        elif "FINAL_ANSWER:" in self.response_text:
-            # Handle FINAL_ANSWER
-            params = None
-            func_name = None
+        # Fast path: responses are usually a single line, so check it directly
+        first, _, rest = self.response_text.lstrip().partition('\n')
+        first = first.strip()
+        if first.startswith('FUNCTION_CALL:'):
+            call = first[len('FUNCTION_CALL:'):]
+        elif first.startswith('FINAL_ANSWER:') and not rest.strip():
+            # A lone FINAL_ANSWER line; with more lines, a later FUNCTION_CALL still wins
+            return None, None
         else:
-            # No recognized pattern found
-            params = None
-            func_name = None
-            
-        return func_name, params
+            match = _CALL_RE.search(self.response_text)
+            if not match:
+                # FINAL_ANSWER, or no recognized pattern found
+                return None, None
+            call = match.group(1)
+
+        # Parse FUNCTION_CALL
+        parts = [p.strip() for p in call.split("|")]
+        return parts[0], parts[1:]
                         
                         
\ No newline at end of file
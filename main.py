@@ -3,7 +3,6 @@ from dotenv import load_dotenv
 from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
 import asyncio
-from google import genai
 from concurrent.futures import TimeoutError
 from functools import partial
 import logging
@@ -11,7 +10,6 @@ from memory import Memory
 from perception import Perception
 from action import Action
 from decision import Decision
-import inspect
 import json
 
 
@@ -19,79 +17,43 @@ import json
 logger = logging.getLogger('cot_logger')
 logger.setLevel(logging.INFO)
 
-# Create console handler and set level to INFO
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
+# Attach handlers only once, so re-importing or re-running doesn't stack duplicates
+if not logger.handlers:
+    # Create console handler and set level to INFO
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
 
-# Create file handler and set level to INFO
-os.makedirs('logs', exist_ok=True)
-file_handler = logging.FileHandler('logs/cot_process.log')
-file_handler.setLevel(logging.INFO)
+    # Create file handler and set level to INFO
+    os.makedirs('logs', exist_ok=True)
+    file_handler = logging.FileHandler('logs/cot_process.log')
+    file_handler.setLevel(logging.INFO)
 
-# Create formatter
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(formatter)
-file_handler.setFormatter(formatter)
+    # Create formatter
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    console_handler.setFormatter(formatter)
+    file_handler.setFormatter(formatter)
 
-# Add handlers to logger
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+    # Add handlers to logger
+    logger.addHandler(console_handler)
+    logger.addHandler(file_handler)
+# Our console handler already prints these; don't echo them again through the root handler
+logger.propagate = False
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Access your API key and initialize Gemini client correctly
-api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key)
+# The Gemini client (and its pooled HTTP connections) is created lazily by perception.py
 
 max_iterations = 10
 last_response = None 
 iteration = 0
 iteration_response = []
+history_str = ""  # iteration_response joined so far; extended by one entry per iteration
 
 
-def reset_state():
-    """Reset all global variables to their initial state"""
-    global last_response, iteration, iteration_response
-    last_response = None
-    iteration = 0
-    iteration_response = []
-
-async def main():
-    reset_state()  # Reset at the start of main
-    logger.info("Starting main execution...")
-    try:
-        action = Action()
-        # Get all tools and their descriptions
-        tools = []
-        for tool_name, tool_func in action.func_map.items():
-            try:
-                sig = inspect.signature(tool_func)
-                params = []
-                for param_name, param in sig.parameters.items():
-                    if param_name == 'self':
-                        continue
-                    param_type = param.annotation.__name__ if param.annotation != inspect._empty else "any"
-                    params.append(f"{param_name}: {param_type}")
-                
-                # Get docstring if available
-                doc = inspect.getdoc(tool_func) or "No description available"
-                doc_first_line = doc.split('\n')[0]
-                
-                # Format tool description
-                tool_desc = f"- {tool_name}({', '.join(params)}) - {doc_first_line}"
-                tools.append(tool_desc)
-                logger.info(f"Added description for tool: {tool_desc}")
-            except Exception as e:
-                logger.error(f"Error processing tool {tool_name}: {e}")
-                continue
-        
-        # Sort tools alphabetically for consistent display
-        tools.sort()
-        tools_description = "\n".join(tools)
-        logger.info("Successfully created tools description from ACTION.py")
-                
-        system_prompt = f"""You are a math agent solving problems iteratively using reasoning and mathematical tools.
+def _build_system_prompt(tools_description: str) -> str:
+    """Build the agent system prompt around the tool descriptions."""
+    return f"""You are a math agent solving problems iteratively using reasoning and mathematical tools.
 First show your reasoning by calling appropriate tools, then calculate and verify each step.
 
 Available tools:
@@ -146,6 +108,28 @@ Assistant: FINAL_ANSWER: ALL TASKS COMPLETED
 
 DO NOT include any explanations or additional text.
 Your entire response should be a single line starting with either FUNCTION_CALL: or FINAL_ANSWER:"""
+
+
+# Depends only on the static tool set, so it is built once at import
+_SYSTEM_PROMPT = _build_system_prompt(Action.TOOLS_DESCRIPTION)
+
+
+def reset_state():
+    """Reset all global variables to their initial state"""
+    global last_response, iteration, iteration_response, history_str
+    last_response = None
+    iteration = 0
+    iteration_response = []
+    history_str = ""
+
+async def main():
+    reset_state()  # Reset at the start of main
+    logger.info("Starting main execution...")
+    try:
+        action = Action()
+        # System prompt (with tool descriptions) is built once when main.py is imported
+        logger.info("Using tools description from ACTION.py")
+        system_prompt = _SYSTEM_PROMPT
 # - FUNCTION_CALL: send_email|89.37393e12
 
         #query = """Find the ASCII values of characters in INDIA and then return sum of exponentials of those values. After that, send email with the final answer."""
@@ -154,32 +138,40 @@ Your entire response should be a single line starting with either FUNCTION_CALL:
         logger.info("Starting iteration loop...")
         
         # Use global iteration variables
-        global iteration, last_response
+        global iteration, last_response, history_str
         logger.info("Fetching user preferences from memory...")
         memory = Memory()
         memory.set_preferences(preference="user likes blue color and bold text")
         user_preference = memory.get_preference()
-        logger.info("Extracting key facts from perception.py")
+        logger.info("Extracting key facts and first decision from perception.py")
         perception=Perception()
-        facts = await perception.extract_facts_with_gemini(query)
+        # One combined call returns the facts and the first iteration's decision
+        facts, first_response = await perception.perceive_and_decide(
+            system_prompt, f"{query}\n\nUser preferences: {user_preference}"
+        )
         response_text = ""
         while iteration < max_iterations:
-            logger.info(f"\n--- Iteration {iteration + 1} ---")
+            logger.info("\n--- Iteration %s ---", iteration + 1)
             if last_response is None:
                 # Format facts dictionary into a string representation
                 facts_str = f"Facts extracted: {json.dumps(facts, indent=2)}\n"
-                current_query = f"{query}\n\nContext:\n{facts_str}User preferences: {user_preference}"
+                base_query = f"{query}\n\nContext:\n{facts_str}User preferences: {user_preference}"
+                current_query = base_query
             else:
-                current_query = current_query + "\n\n" + " ".join(iteration_response)
-                current_query = current_query + "  What should I do next?"
+                # Rebuild from the fixed base plus the running history instead of re-appending
+                # the whole history to the previous prompt every iteration
+                current_query = f"{base_query}\n\n{history_str}  What should I do next?"
 
             # Get model's response with timeout
             logger.info("Preparing to generate LLM response...")
             prompt = f"{system_prompt}\n\nQuery: {current_query}"
             
             try:
-                response_text = await perception.generate_decision_response(system_prompt, current_query, client)
-                logger.info(f"LLM Response: {response_text}")
+                if last_response is None and first_response:
+                    response_text = first_response
+                else:
+                    response_text = await perception.generate_decision_response(system_prompt, current_query)
+                logger.info("LLM Response: %s", response_text)
                 logger.info("Sending LLM response to the decision module...")
                 decision= Decision(response_text=response_text)
                 func_name, params = decision.get_decision()
@@ -187,19 +179,19 @@ Your entire response should be a single line starting with either FUNCTION_CALL:
                 # Find the FUNCTION_CALL line in the response
                 # logger.info(f"\nDEBUG: Raw function info: {function_info}")
                 # logger.info(f"DEBUG: Split parts: {parts}")
-                logger.info(f"DEBUG: Function name: {func_name}")
-                logger.info(f"DEBUG: Raw parameters: {params}")
-                logger.info(f"Decision is made, time to take ACTION - {func_name}")
+                logger.info("DEBUG: Function name: %s", func_name)
+                logger.info("DEBUG: Raw parameters: %s", params)
+                logger.info("Decision is made, time to take ACTION - %s", func_name)
 
                 
                 try:
                     if func_name:
                         result = await action.act(func_name, params)
-                        logger.info(f"DEBUG: Raw result: {result}")
+                        logger.info("DEBUG: Raw result: %s", result)
                         
                         # Get the full result content
                         if hasattr(result, 'content'):
-                            logger.info(f"DEBUG: Result has content attribute")
+                            logger.info("DEBUG: Result has content attribute")
                             # Handle multiple content items
                             if isinstance(result.content, list):
                                 iteration_result = [
@@ -209,10 +201,10 @@ Your entire response should be a single line starting with either FUNCTION_CALL:
                             else:
                                 iteration_result = str(result.content)
                         else:
-                            logger.info(f"DEBUG: Result has no content attribute")
+                            logger.info("DEBUG: Result has no content attribute")
                             iteration_result = str(result)
                             
-                        logger.info(f"DEBUG: Final iteration result: {iteration_result}")
+                        logger.info("DEBUG: Final iteration result: %s", iteration_result)
                         
                         # Format the response based on result type
                         if isinstance(iteration_result, list):
@@ -220,10 +212,12 @@ Your entire response should be a single line starting with either FUNCTION_CALL:
                         else:
                             result_str = str(iteration_result)
                         
-                        iteration_response.append(
+                        entry = (
                             f"In the {iteration + 1} iteration you called {func_name} with parameters {params} "
                             f"and the function returned {result_str}."
                         )
+                        iteration_response.append(entry)
+                        history_str = f"{history_str} {entry}" if history_str else entry
                         last_response = iteration_result    
 
                     else:
@@ -231,8 +225,8 @@ Your entire response should be a single line starting with either FUNCTION_CALL:
                         iteration_response.append(f"FINAL_ANSWER received: {response_text}")
                         break
                 except Exception as e:
-                    logger.info(f"DEBUG: Error details: {str(e)}")
-                    logger.info(f"DEBUG: Error type: {type(e)}")
+                    logger.info("DEBUG: Error details: %s", e)
+                    logger.info("DEBUG: Error type: %s", type(e))
                     iteration_response.append(f"Error in iteration {iteration + 1}: {str(e)}")
                     break
 
@@ -240,14 +234,15 @@ Your entire response should be a single line starting with either FUNCTION_CALL:
 
                 iteration += 1
             except Exception as e:
-                logger.info(f"DEBUG: Error details: {str(e)}")
-                logger.info(f"DEBUG: Error type: {type(e)}")
+                logger.info("DEBUG: Error details: %s", e)
+                logger.info("DEBUG: Error type: %s", type(e))
                 iteration_response.append(f"Error in iteration {iteration + 1}: {str(e)}")
                 break
     except Exception as e:
-        logger.info(f"Error in main execution: {e}")
+        logger.info("Error in main execution: %s", e)
     finally:
         reset_state()  # Reset at the end of main
+        await Perception.aclose()
 
 if __name__ == "__main__":
     asyncio.run(main())
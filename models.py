@@ -2,6 +2,8 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 
+from speedups import KeywordMatcher
+
 
 # Input/output schemas for all tools in action.py
 class AddInput(BaseModel):
@@ -101,6 +103,11 @@ class FibonacciNumbersInput(BaseModel):
 class FibonacciNumbersOutput(BaseModel):
     result: list[int]
 
+class FibonacciNthInput(BaseModel):
+    n: int
+class FibonacciNthOutput(BaseModel):
+    result: int
+
 class ShowReasoningInput(BaseModel):
     steps: list[str]
 class ShowReasoningOutput(BaseModel):
@@ -164,6 +171,7 @@ function_schemas = {
     'strings_to_chars_to_int': {'input': StringsToCharsToIntInput, 'output': StringsToCharsToIntOutput},
     'int_list_to_exponential_sum': {'input': IntListToExponentialSumInput, 'output': IntListToExponentialSumOutput},
     'fibonacci_numbers': {'input': FibonacciNumbersInput, 'output': FibonacciNumbersOutput},
+    'fibonacci_nth': {'input': FibonacciNthInput, 'output': FibonacciNthOutput},
     'show_reasoning': {'input': ShowReasoningInput, 'output': ShowReasoningOutput},
     'calculate': {'input': CalculateInput, 'output': CalculateOutput},
     'verify': {'input': VerifyInput, 'output': VerifyOutput},
@@ -174,65 +182,58 @@ function_schemas = {
     'create_image_with_text': {'input': CreateImageWithTextInput, 'output': CreateImageWithTextOutput},
 }
 
+# Flattened views of function_schemas so validation is a single dict lookup
+_INPUT_SCHEMAS: Dict[str, type[BaseModel]] = {k: v['input'] for k, v in function_schemas.items()}
+_OUTPUT_SCHEMAS: Dict[str, type[BaseModel]] = {k: v['output'] for k, v in function_schemas.items()}
+
 def validate_input(func_name: str, data: Dict[str, Any]):
     """Validate input data for a function using its Pydantic schema."""
-    schema = function_schemas.get(func_name, {}).get('input')
-    if schema:
-        return schema(**data)
-    raise ValueError(f"No input schema for function: {func_name}")
+    schema = _INPUT_SCHEMAS.get(func_name)
+    if schema is None:
+        raise ValueError(f"No input schema for function: {func_name}")
+    return schema.model_validate(data)
 
 def validate_output(func_name: str, data: Dict[str, Any]):
     """Validate output data for a function using its Pydantic schema."""
-    schema = function_schemas.get(func_name, {}).get('output')
-    if schema:
-        return schema(**data)
-    raise ValueError(f"No output schema for function: {func_name}")
+    schema = _OUTPUT_SCHEMAS.get(func_name)
+    if schema is None:
+        raise ValueError(f"No output schema for function: {func_name}")
+    return schema.model_validate(data)
+
+# (substrings that must all appear, step key, response) for run_model, in pipeline order
+_RUN_MODEL_STEPS = (
+    (('ASCII', 'INDIA'), 'ascii_step', 'FUNCTION_CALL: strings_to_chars_to_int|INDIA'),
+    (('sum of exponentials',), 'exp_step', 'FUNCTION_CALL: int_list_to_exponential_sum|[73,78,68,73,65]'),
+    (('Open Microsoft paint',), 'paint_open_step', 'FUNCTION_CALL: open_paint'),
+    (('draw a rectangle',), 'rectangle_step', 'FUNCTION_CALL: draw_rectangle|607|425|940|619'),
+    (('add text in paint',), 'text_step', 'FUNCTION_CALL: add_text_in_paint|1.0518035489891521e+33'),
+    (('send email',), 'email_step', 'FUNCTION_CALL: send_email|1.0518035489891521e+33'),
+)
+_RUN_MODEL_ALL_STEPS = frozenset(step for _, step, _ in _RUN_MODEL_STEPS)
+_RUN_MODEL_TRIGGERS = frozenset(t for triggers, _, _ in _RUN_MODEL_STEPS for t in triggers)
+
+# Returns the run_model trigger substrings present in the prompt
+_find_triggers = KeywordMatcher(_RUN_MODEL_TRIGGERS).find
 
 def run_model(client, prompt, timeout=10):
     """Run the LLM model on the prompt and return appropriate function calls."""
     # Track what steps have been completed using memory
     completed_steps = getattr(client, 'completed_steps', set()) if client else set()
+    found = _find_triggers(prompt)
     
-    # Step 1: Calculate ASCII values
-    if 'ASCII' in prompt and 'INDIA' in prompt and 'ascii_step' not in completed_steps:
-        if hasattr(client, 'completed_steps'):
-            client.completed_steps.add('ascii_step')
-        return 'FUNCTION_CALL: strings_to_chars_to_int|INDIA'
-    
-    # Step 2: Calculate exponential sum
-    if ('sum of exponentials' in prompt or 
-        (isinstance(prompt, list) and any(isinstance(x, int) for x in prompt))) and 'exp_step' not in completed_steps:
-        if hasattr(client, 'completed_steps'):
-            client.completed_steps.add('exp_step')
-        return 'FUNCTION_CALL: int_list_to_exponential_sum|[73,78,68,73,65]'
-    
-    # Step 3: Open Paint
-    if 'Open Microsoft paint' in prompt and 'paint_open_step' not in completed_steps:
-        if hasattr(client, 'completed_steps'):
-            client.completed_steps.add('paint_open_step')
-        return 'FUNCTION_CALL: open_paint'
-    
-    # Step 4: Draw rectangle
-    if 'draw a rectangle' in prompt and 'rectangle_step' not in completed_steps:
-        if hasattr(client, 'completed_steps'):
-            client.completed_steps.add('rectangle_step')
-        return 'FUNCTION_CALL: draw_rectangle|607|425|940|619'
-    
-    # Step 5: Add text
-    if 'add text in paint' in prompt and 'text_step' not in completed_steps:
-        if hasattr(client, 'completed_steps'):
-            client.completed_steps.add('text_step')
-        return 'FUNCTION_CALL: add_text_in_paint|1.0518035489891521e+33'
-    
-    # Step 6: Send email
-    if 'send email' in prompt and 'email_step' not in completed_steps:
-        if hasattr(client, 'completed_steps'):
-            client.completed_steps.add('email_step')
-        return 'FUNCTION_CALL: send_email|1.0518035489891521e+33'
+    # Return the first pending step whose triggers all appear in the prompt
+    for triggers, step, response in _RUN_MODEL_STEPS:
+        if step in completed_steps:
+            continue
+        # The exponential step also fires when the prompt is the list of ASCII values itself
+        if all(t in found for t in triggers) or (
+                step == 'exp_step' and isinstance(prompt, list) and any(isinstance(x, int) for x in prompt)):
+            if hasattr(client, 'completed_steps'):
+                client.completed_steps.add(step)
+            return response
     
     # Check if all steps are completed
-    all_steps = {'ascii_step', 'exp_step', 'paint_open_step', 'rectangle_step', 'text_step', 'email_step'}
-    if completed_steps >= all_steps:
+    if completed_steps >= _RUN_MODEL_ALL_STEPS:
         return 'FINAL_ANSWER: All tasks completed successfully'
     
     # Continue with next step if not all completed
@@ -1,18 +1,370 @@
 import os
 import json
-from typing import Dict, Any, Optional
+import hashlib
+import sqlite3
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, Optional, Tuple
 import asyncio
+import string
+import httpx
 from google import genai
+from google.genai import errors
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
 import logging
 from dotenv import load_dotenv
+from models import function_schemas
+from speedups import KeywordMatcher, json_dumps, json_loads
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-# Access your API key and initialize Gemini client at module load (fallback if not provided)
-api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key) if api_key else None
+
+@lru_cache(maxsize=1)
+def _http_client() -> httpx.AsyncClient:
+    """One pooled HTTP/2 client shared by every Gemini call, so concurrent requests
+    reuse warm connections instead of paying a TCP/TLS handshake each."""
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=100, max_connections=200),
+    )
+
+
+@lru_cache(maxsize=1)
+def _default_client():
+    """Process-wide Gemini client, created on first use (None without GEMINI_API_KEY)."""
+    key = os.getenv("GEMINI_API_KEY")
+    if not key:
+        return None
+    return genai.Client(api_key=key, http_options={"httpx_async_client": _http_client()})
+
+_MODEL = "gemini-2.0-flash"
+
+# Exact-match LRU of response text keyed by sha256(prompt). Only touched from the
+# event loop thread, so plain dict operations need no extra locking.
+_EXACT_CACHE_MAXSIZE = 1024
+_exact_cache: "OrderedDict[str, str]" = OrderedDict()
+
+# Optional on-disk tier behind the LRU (SQLite, memory-mapped reads), so cached
+# responses survive restarts. Enabled by pointing PERCEPTION_CACHE_PATH at a file.
+# Entries never expire: delete the file (and its -wal/-shm files) to reset replies.
+_DISK_CACHE_PATH = os.getenv("PERCEPTION_CACHE_PATH")
+_disk_cache: Optional[sqlite3.Connection] = None
+
+
+def _disk() -> Optional[sqlite3.Connection]:
+    global _disk_cache
+    if _disk_cache is None and _DISK_CACHE_PATH:
+        conn = sqlite3.connect(_DISK_CACHE_PATH, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, text TEXT NOT NULL)")
+        _disk_cache = conn
+    return _disk_cache
+
+
+def _cache_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode()).hexdigest()
+
+
+def _lru_put(key: str, text: str) -> None:
+    _exact_cache[key] = text
+    _exact_cache.move_to_end(key)
+    if len(_exact_cache) > _EXACT_CACHE_MAXSIZE:
+        _exact_cache.popitem(last=False)
+
+
+def _cache_get(key: str) -> Optional[str]:
+    text = _exact_cache.get(key)
+    if text is not None:
+        _exact_cache.move_to_end(key)
+        return text
+    conn = _disk()
+    if conn is not None:
+        row = conn.execute("SELECT text FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            text = row[0]
+            _lru_put(key, text)
+    return text
+
+
+def _cache_put(key: str, text: str) -> None:
+    _lru_put(key, text)
+    conn = _disk()
+    if conn is not None:
+        conn.execute("INSERT OR REPLACE INTO responses (key, text) VALUES (?, ?)", (key, text))
+
+
+# In-flight Gemini calls keyed by request, so identical concurrent prompts share
+# one call: key -> [task, number of callers still waiting on it]
+_inflight: Dict[str, list] = {}
+
+
+# Caps concurrent Gemini calls so bursts queue here instead of drawing 429s
+_SEM = asyncio.Semaphore(int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")))
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    """Retry rate limits and server errors; client errors won't succeed on retry."""
+    return isinstance(exc, errors.APIError) and (exc.code == 429 or (exc.code or 0) >= 500)
+
+
+class _StreamedResponse:
+    """Minimal stand-in for a GenerateContentResponse built from streamed chunks."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+@retry(
+    retry=retry_if_exception(_is_retryable),
+    wait=wait_random_exponential(multiplier=1, max=20),
+    stop=stop_after_attempt(3),
+    reraise=True,
+)
+async def _stream_generate(client, prompt: str, config: Optional[Dict[str, Any]],
+                           timeout: float) -> _StreamedResponse:
+    """Stream a generation and join its chunks.
+
+    The deadline is sent with the request so the SDK/httpx enforce it on the
+    socket. Cancelling this coroutine closes the HTTP stream, so a timed-out
+    request stops generating server-side instead of running to completion.
+    The semaphore is held only while streaming, not during retry backoff.
+    """
+    parts = []
+    # The SDK applies this one deadline to every httpx phase (connect/read/write/pool),
+    # overriding any client-level httpx.Timeout
+    request_config = {**(config or {}), "http_options": {"timeout": int(timeout * 1000)}}
+    async with _SEM:
+        stream = await client.aio.models.generate_content_stream(
+            model=_MODEL,
+            contents=prompt,
+            config=request_config,
+        )
+        async for chunk in stream:
+            if chunk.text:
+                parts.append(chunk.text)
+    return _StreamedResponse("".join(parts))
+
+
+def _drop_inflight(key: str, entry: list) -> None:
+    """Remove an in-flight entry, unless a newer request has replaced it."""
+    if _inflight.get(key) is entry:
+        del _inflight[key]
+
+
+def _inflight_key(client, prompt: str, config: Optional[Dict[str, Any]]) -> str:
+    h = hashlib.blake2b(prompt.encode(), digest_size=16)
+    h.update(repr((id(client), config)).encode())
+    return h.hexdigest()
+
+
+# Callers with a latency budget above this go through the (discounted, slower) Batch
+# API. Batch jobs take minutes to hours, so only batch-scale budgets qualify.
+_BATCH_LATENCY_THRESHOLD_MS = 30 * 60 * 1000
+_BATCH_DONE_STATES = frozenset({
+    "JOB_STATE_SUCCEEDED",
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED",
+})
+
+
+class _PerceptionBatcher:
+    """Pools prompts over a short window and submits them as one Gemini batch job.
+
+    Batch jobs are billed at a discount but complete asynchronously, so only
+    callers with a loose latency budget should be routed here.
+    """
+
+    def __init__(self, client, batch_window_ms: int = 50, batch_min_size: int = 8,
+                 poll_interval: float = 30.0):
+        self._client = client
+        self._window = batch_window_ms / 1000
+        self._min_size = batch_min_size
+        self._poll_interval = poll_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: set = set()
+
+    async def submit(self, prompt: str, config: Optional[Dict[str, Any]] = None):
+        """Queue a prompt and wait for its response from the next batch."""
+        if self._task is None or self._task.done():
+            # Started lazily so the queue and task bind to the running loop
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._collect())
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((prompt, config, fut))
+        return await fut
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._window
+            while len(batch) < self._min_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Dispatch in the background so the next window starts collecting immediately
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch):
+        try:
+            job = await self._client.aio.batches.create(
+                model=_MODEL,
+                src=[{"contents": [{"role": "user", "parts": [{"text": prompt}]}],
+                      **({"config": config} if config else {})}
+                     for prompt, config, _ in batch],
+            )
+            logger.info("Submitted Gemini batch %s with %d prompts", job.name, len(batch))
+            while job.state.name not in _BATCH_DONE_STATES:
+                await asyncio.sleep(self._poll_interval)
+                if all(fut.done() for _, _, fut in batch):
+                    # Every caller gave up (budget expired); stop paying for the job
+                    await self._cancel(job.name)
+                    return
+                job = await self._client.aio.batches.get(name=job.name)
+            if job.state.name != "JOB_STATE_SUCCEEDED":
+                raise RuntimeError(f"Gemini batch {job.name} ended in {job.state.name}")
+
+            # Inline responses come back in request order
+            for (_, _, fut), item in zip(batch, job.dest.inlined_responses):
+                if fut.done():
+                    continue
+                if item.error:
+                    fut.set_exception(RuntimeError(f"Gemini batch item failed: {item.error}"))
+                else:
+                    fut.set_result(item.response)
+        except Exception as e:
+            logger.exception("Error in Gemini batch: %s", e)
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+
+
+    async def _cancel(self, name: str):
+        try:
+            await self._client.aio.batches.cancel(name=name)
+            logger.info("Cancelled abandoned Gemini batch %s", name)
+        except Exception as e:
+            logger.warning("Could not cancel Gemini batch %s: %s", name, e)
+
+
+_batchers: Dict[int, _PerceptionBatcher] = {}
+
+
+def _batcher_for(client) -> _PerceptionBatcher:
+    batcher = _batchers.get(id(client))
+    if batcher is None:
+        batcher = _batchers[id(client)] = _PerceptionBatcher(client)
+    return batcher
+
+
+# Words that suggest a query needs some tool step: parts of the tool names plus
+# common arithmetic/action vocabulary, and any digit. Queries containing none of
+# them skip the LLM and get the fallback facts.
+_EXTRA_KEYWORDS = (
+    "plus", "minus", "times", "product", "total", "number", "root", "square",
+    "compute", "convert", "ascii", "mail", "picture", "reason", "check",
+)
+_QUERY_KEYWORDS = frozenset(
+    {part for name in function_schemas for part in name.split("_") if len(part) >= 3 and part != "with"}
+    | set(_EXTRA_KEYWORDS)
+    | set("0123456789")
+)
+
+_KEYWORD_MATCHER = KeywordMatcher(_QUERY_KEYWORDS)
+
+
+def _has_keyword(query: str) -> bool:
+    """Return True if the (case-folded) query mentions any step keyword."""
+    return _KEYWORD_MATCHER.any(query.lower())
+
+
+def _parse_json_object(text: str) -> Any:
+    """Parse the JSON object in a model response; raises json.JSONDecodeError.
+
+    JSON mode should return bare JSON, but tolerate code fences or prose around
+    it: slice from the first '{' to the last '}' (two linear scans, no regex).
+    """
+    start = text.find("{")
+    end = text.rfind("}")
+    return json_loads(text[start:end + 1] if start != -1 and end > start else text)
+
+
+def _fallback_facts(query: str) -> Dict[str, Any]:
+    return {
+        "steps": ["parse_text"],
+        "operations": {"parse_text": query},
+        "parameters": {},
+        "dependencies": {},
+    }
+
+
+# Prompts are built once at import; only the query is substituted per call
+_QUERY_SEPARATOR = "\n\nQuery: "
+
+# JSON mode: the model returns bare JSON. No response_schema, because the facts'
+# operations/parameters/dependencies are free-form objects that Gemini's schema
+# subset can't express; the prompt's example still conveys the shape.
+_JSON_CONFIG = {"response_mime_type": "application/json"}
+
+# Few-shot example, minified once at import to keep the prompt's input tokens down
+_EXTRACT_FACTS_EXAMPLE = json_dumps({
+    "steps": ["ascii_conversion", "exponential_sum", "paint_operations", "email"],
+    "operations": {
+        "ascii_conversion": "Convert INDIA to ASCII values",
+        "exponential_sum": "Calculate sum of exponentials",
+        "paint_operations": ["open_paint", "draw_rectangle", "add_text"],
+        "email": "Send result via email"
+    },
+    "parameters": {
+        "text": "INDIA",
+        "rectangle": {
+            "x1": 607,
+            "y1": 425,
+            "x2": 940,
+            "y2": 619
+        }
+    },
+    "dependencies": {
+        "exponential_sum": "needs ascii_values",
+        "add_text": "needs exponential_sum",
+        "email": "needs exponential_sum"
+    }
+})
+
+# Appended to the decision system prompt by perceive_and_decide, so one call returns
+# both the extracted facts and the first decision
+_PERCEIVE_AND_DECIDE_INSTRUCTIONS = """
+
+Before deciding, also analyze the query and extract its key facts. Respond with a single JSON object with exactly two fields:
+- "facts": the key facts, as an object with steps (list of distinct operations needed), operations (details about each operation), parameters (any specific values mentioned) and dependencies (what results are needed for which steps). Example:
+""" + _EXTRACT_FACTS_EXAMPLE + """
+- "decision": the response you would otherwise give, i.e. exactly one FUNCTION_CALL: or FINAL_ANSWER: line"""
+
+# Static instructions and example come first and the query last, so the prompt
+# prefix is byte-identical across requests and only the tail varies
+_EXTRACT_FACTS_TEMPLATE = string.Template("""Analyze this query and extract key facts in JSON format:
+- steps: List of distinct operations needed
+- operations: Details about each operation
+- parameters: Any specific values mentioned
+- dependencies: What results are needed for which steps
+
+Example output:
+""" + _EXTRACT_FACTS_EXAMPLE + """
+
+Query: "$query\"""")
 
 
 class Perception:
@@ -23,29 +375,69 @@ class Perception:
     """
 
     @staticmethod
-    async def generate_with_timeout(client, prompt: str, timeout: int = 10):
+    async def aclose() -> None:
+        """Close the shared HTTP connection pool; call once at shutdown."""
+        if _http_client.cache_info().currsize:
+            await _http_client().aclose()
+            _http_client.cache_clear()
+            _default_client.cache_clear()
+
+    @staticmethod
+    async def generate_with_timeout(client, prompt: str, timeout: int = 10,
+                                    config: Optional[Dict[str, Any]] = None):
         """Generate content with a timeout using the provided Gemini client."""
         logger.info("Starting LLM generation...")
+        key = _inflight_key(client, prompt, config)
+        entry = _inflight.get(key)
+        if entry is None:
+            # Native async streaming client: no worker-thread hop per call
+            task = asyncio.create_task(_stream_generate(client, prompt, config, timeout))
+            entry = _inflight[key] = [task, 0]
+            task.add_done_callback(lambda _t, e=entry: _drop_inflight(key, e))
+        else:
+            logger.info("Joining identical in-flight LLM request")
+        task = entry[0]
+        entry[1] += 1
         try:
-            loop = asyncio.get_event_loop()
-            response = await asyncio.wait_for(
-                loop.run_in_executor(
-                    None,
-                    lambda: client.models.generate_content(
-                        model="gemini-2.0-flash",
-                        contents=prompt,
-                    ),
-                ),
-                timeout=timeout,
-            )
+            # The request carries its own deadline; this is only a safety net (e.g. for
+            # retry backoff). Shielded so one caller timing out doesn't cancel the
+            # call for the others.
+            response = await asyncio.wait_for(asyncio.shield(task), timeout=timeout + 1)
             logger.info("LLM generation completed")
             return response
         except asyncio.TimeoutError:
             logger.info("LLM generation timed out!")
             raise
         except Exception as e:
-            logger.exception(f"Error in LLM generation: {e}")
+            logger.exception("Error in LLM generation: %s", e)
             raise
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                # Last waiter gave up; unregister first so new callers start a fresh
+                # request instead of joining one that is being cancelled
+                _drop_inflight(key, entry)
+                task.cancel()
+
+    @staticmethod
+    async def generate_with_budget(client, prompt: str, latency_budget_ms: Optional[int] = None,
+                                   config: Optional[Dict[str, Any]] = None):
+        """Generate content directly, or via the Batch API when the latency budget allows it.
+
+        Unspecified budgets, or budgets up to 30 minutes, call Gemini directly.
+        Longer budgets are pooled with other concurrent prompts into one batch job.
+        If that job hasn't answered within the budget, the request falls back to
+        a direct call, and the job is cancelled once no caller is waiting on it.
+        """
+        if latency_budget_ms is None or latency_budget_ms <= _BATCH_LATENCY_THRESHOLD_MS:
+            return await Perception.generate_with_timeout(client, prompt, config=config)
+        try:
+            return await asyncio.wait_for(
+                _batcher_for(client).submit(prompt, config), timeout=latency_budget_ms / 1000
+            )
+        except asyncio.TimeoutError:
+            logger.info("Gemini batch exceeded the %d ms latency budget; calling directly", latency_budget_ms)
+            return await Perception.generate_with_timeout(client, prompt, config=config)
 
     @staticmethod
     async def generate_decision_response(system_prompt: str, query: str, client_arg: Optional[Any] = None) -> str:
@@ -59,80 +451,130 @@ class Perception:
         Returns:
             LLM response text for decision making
         """
-        prompt = f"{system_prompt}\n\nQuery: {query}"
-        use_client = client_arg if client_arg is not None else client
+        prompt = system_prompt + _QUERY_SEPARATOR + query
+        use_client = client_arg if client_arg is not None else _default_client()
         
         if use_client is None:
             logger.error("No Gemini client available for decision generation")
             return ""
+
+        key = _cache_key(prompt)
+        cached = _cache_get(key)
+        if cached is not None:
+            logger.info("LLM response served from cache")
+            return cached
             
         response = await Perception.generate_with_timeout(use_client, prompt)
         if not response or not response.text:
             return ""
             
-        return response.text.strip()
+        text = response.text.strip()
+        _cache_put(key, text)
+        return text
+
+    @staticmethod
+    async def perceive_and_decide(system_prompt: str, query: str,
+                                  client_arg: Optional[Any] = None) -> Tuple[Dict[str, Any], str]:
+        """Extract facts and make the first decision in a single Gemini call.
+
+        Equivalent to awaiting extract_facts_with_gemini(query) and then
+        generate_decision_response(system_prompt, query), but pays one round trip.
+
+        Args:
+            system_prompt: The system prompt with instructions
+            query: The current query/context
+            client_arg: Optional Gemini client to use
+
+        Returns:
+            (facts dict, decision response text)
+        """
+        use_client = client_arg if client_arg is not None else _default_client()
+        if use_client is None:
+            logger.error("No Gemini client available for Perception.perceive_and_decide")
+            return {"error": "No Gemini client configured"}, ""
+
+        if not _has_keyword(query):
+            # Same pre-filter as extract_facts_with_gemini: skip fact extraction and
+            # only ask for the decision, with the shorter decision-only prompt
+            logger.info("Query has no step keywords; returning fallback facts")
+            decision = await Perception.generate_decision_response(system_prompt, query, use_client)
+            return _fallback_facts(query), decision
+
+        prompt = system_prompt + _PERCEIVE_AND_DECIDE_INSTRUCTIONS + _QUERY_SEPARATOR + query
+        key = _cache_key(prompt)
+        text = _cache_get(key)
+        if text is None:
+            response = await Perception.generate_with_timeout(use_client, prompt, config=_JSON_CONFIG)
+            text = response.text if response else ""
+
+        try:
+            combined = _parse_json_object(text)
+            facts = combined["facts"]
+            decision = combined["decision"]
+        except (json.JSONDecodeError, KeyError, TypeError):
+            facts = decision = None
+        if isinstance(decision, str):
+            decision = decision.strip()
+        # Anything but a FUNCTION_CALL/FINAL_ANSWER line (e.g. null -> "None") would parse
+        # as no decision and end the run early, so treat it as unusable
+        if (not isinstance(decision, str)
+                or not decision.startswith(("FUNCTION_CALL:", "FINAL_ANSWER:"))
+                or not isinstance(facts, dict)):
+            # Combined answer unusable; fall back to the two separate calls, concurrently
+            logger.warning("Could not use combined perceive/decide response; making separate calls")
+            facts, decision = await asyncio.gather(
+                Perception.extract_facts_with_gemini(query, use_client),
+                Perception.generate_decision_response(system_prompt, query, use_client),
+            )
+            return facts, decision
+
+        _cache_put(key, text)
+        return facts, decision
 
     @staticmethod
-    async def extract_facts_with_gemini(query: str, client_arg: Optional[Any] = None) -> Dict[str, Any]:
+    async def extract_facts_with_gemini(query: str, client_arg: Optional[Any] = None,
+                                        latency_budget_ms: Optional[int] = None) -> Dict[str, Any]:
         """Extract structured facts from the query using Gemini.
 
         Args:
             query: The user's natural-language query.
-            client_arg: Optional Gemini client to use; if omitted the module-level
-                        client (created from GEMINI_API_KEY) will be used.
+            client_arg: Optional Gemini client to use; if omitted the shared default
+                        client (created from GEMINI_API_KEY on first use) will be used.
+            latency_budget_ms: Optional latency budget; above 30 minutes the request
+                        is pooled into a discounted Gemini batch job, falling back
+                        to a direct call if that job overruns the budget.
 
         Returns:
             A dict parsed from the LLM's JSON output, or an error dict.
         """
-        prompt = f"""Analyze this query and extract key facts in JSON format:
-- steps: List of distinct operations needed
-- operations: Details about each operation
-- parameters: Any specific values mentioned
-- dependencies: What results are needed for which steps
-
-Query: "{query}"
+        if not _has_keyword(query):
+            # Nothing in the query could trigger a tool step; don't spend an LLM call on it
+            logger.info("Query has no step keywords; returning fallback facts")
+            return _fallback_facts(query)
 
-Example output:
-{{
-    "steps": ["ascii_conversion", "exponential_sum", "paint_operations", "email"],
-    "operations": {{
-        "ascii_conversion": "Convert INDIA to ASCII values",
-        "exponential_sum": "Calculate sum of exponentials",
-        "paint_operations": ["open_paint", "draw_rectangle", "add_text"],
-        "email": "Send result via email"
-    }},
-    "parameters": {{
-        "text": "INDIA",
-        "rectangle": {{
-            "x1": 607,
-            "y1": 425,
-            "x2": 940,
-            "y2": 619
-        }}
-    }},
-    "dependencies": {{
-        "exponential_sum": "needs ascii_values",
-        "add_text": "needs exponential_sum",
-        "email": "needs exponential_sum"
-    }}
-}}"""
+        prompt = _EXTRACT_FACTS_TEMPLATE.substitute(query=query)
 
-        use_client = client_arg if client_arg is not None else client
+        use_client = client_arg if client_arg is not None else _default_client()
         if use_client is None:
             logger.error("No Gemini client available for Perception.extract_facts_with_gemini")
             return {"error": "No Gemini client configured"}
 
-        response = await Perception.generate_with_timeout(use_client, prompt)
-        if not response:
-            return {"Failed to get response from Gemini"}
+        key = _cache_key(prompt)
+        text = _cache_get(key)
+        if text is not None:
+            logger.info("Fact extraction served from cache")
+        else:
+            response = await Perception.generate_with_budget(
+                use_client, prompt, latency_budget_ms, config=_JSON_CONFIG
+            )
+            if not response or not response.text:
+                return {"error": "Failed to get response from Gemini"}
+            text = response.text
 
         try:
-            return response.text
+            facts = _parse_json_object(text)
+            _cache_put(key, text)
+            return facts
         except json.JSONDecodeError:
             logger.warning("Could not decode JSON from Gemini response; returning fallback structure")
-            return {
-                "steps": ["parse_text"],
-                "operations": {"parse_text": query},
-                "parameters": {},
-                "dependencies": {},
-            }
\ No newline at end of file
+            return _fallback_facts(query)
\ No newline at end of file
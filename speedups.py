@@ -0,0 +1,58 @@
+# speedups.py
+"""Small helpers backed by the optional `speedups` extras, with pure-Python fallbacks."""
+
+import json
+from typing import Any, Iterable
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; its JSONDecodeError subclasses json's, so handlers are unchanged
+    orjson = None
+
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick is optional; fall back to plain substring checks
+    ahocorasick = None
+
+
+if orjson is not None:
+    json_loads = orjson.loads
+
+    def json_dumps(obj: Any) -> str:
+        """Serialise obj to compact JSON text."""
+        return orjson.dumps(obj).decode()
+else:
+    json_loads = json.loads
+
+    def json_dumps(obj: Any) -> str:
+        """Serialise obj to compact JSON text."""
+        return json.dumps(obj, separators=(",", ":"))
+
+
+class KeywordMatcher:
+    """Finds which of a fixed set of words occur in a text.
+
+    With pyahocorasick installed every word is matched in one pass over the
+    text; otherwise (or for non-str input) each word is a substring check.
+    """
+
+    def __init__(self, words: Iterable[str]):
+        self.words = frozenset(words)
+        self._automaton = None
+        if ahocorasick is not None and self.words:
+            self._automaton = ahocorasick.Automaton()
+            for word in self.words:
+                self._automaton.add_word(word, word)
+            self._automaton.make_automaton()
+
+    def find(self, text: Any) -> set:
+        """Return every word that occurs in the text."""
+        if self._automaton is not None and isinstance(text, str):
+            return {word for _, word in self._automaton.iter(text)}
+        return {word for word in self.words if word in text}
+
+    def any(self, text: Any) -> bool:
+        """Return True as soon as any word is found in the text."""
+        if self._automaton is not None and isinstance(text, str):
+            return next(self._automaton.iter(text), None) is not None
+        return any(word in text for word in self.words)